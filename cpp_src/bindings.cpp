@@ -6,6 +6,7 @@
 #include "jsonparser.h"
 
 #include <string>
+#include <string_view>
 #include <pybind11/pybind11.h>
 #include <pybind11/stl.h>
 
@@ -17,15 +18,32 @@ PYBIND11_MODULE(_core, m) {
     m.doc() = "C++ streaming JSON parser with Python bindings";
 
     // Expose the StreamJsonParser class along with its
-    // constructor and two functions. 
+    // constructor and its methods.
     // Note that we use getPython for get to return a py::object
+    // consume takes a std::string_view: pybind11 then points it at the str's
+    // cached UTF-8 buffer instead of copying every chunk into a std::string.
     py::class_<StreamingJsonParser>(m, "StreamingJsonParser")
-        .def(py::init<bool>(), py::arg("strict_mode") = false)
-        .def("consume", &StreamingJsonParser::consume)
-        .def("get", &StreamingJsonParser::getPython);
+        .def(py::init<bool, bool>(), py::arg("strict_mode") = false, py::arg("track_checkpoints") = false)
+        .def("consume", &StreamingJsonParser::consume, py::return_value_policy::reference_internal)
+        // UTF-8 bytes are validated in place, no decode to str and back
+        .def("consume_bytes", [](StreamingJsonParser& parser, const py::buffer& buffer) -> StreamingJsonParser& {
+            py::buffer_info info = buffer.request();
+            // Only plain bytes can be read as one run, reject strided views
+            // and wider item types instead of misreading their memory.
+            if (info.ndim != 1 || info.itemsize != 1 || info.strides[0] != 1) {
+                throw py::type_error("consume_bytes() needs a contiguous buffer of bytes");
+            }
+            return parser.consumeBytes(std::string_view(static_cast<const char*>(info.ptr), info.size));
+        }, py::return_value_policy::reference_internal)
+        .def("rewind_to", &StreamingJsonParser::rewindTo, py::arg("pos"))
+        .def("reset", &StreamingJsonParser::reset)
+        // get() returns a dict shared between calls, don't mutate it (same
+        // contract as the Python fallback), get_copy() is the caller's own.
+        .def("get", &StreamingJsonParser::getPython)
+        .def("get_copy", &StreamingJsonParser::getPythonCopy);
             
     // Expose extra function for parsing without explictly creating obj. 
-    m.def("parse_json", [](const std::string& json_str, bool strict_mode = false) {
+    m.def("parse_json", [](std::string_view json_str, bool strict_mode = false) {
             StreamingJsonParser parser(strict_mode);
             parser.consume(json_str);
             return parser.getPython();
@@ -11,49 +11,313 @@
 #include <memory>
 #include <stdexcept>
 #include <cassert>
+#include <algorithm>
+#include <array>
+#include <bit>
+#include <cstdint>
 #include <pybind11/pybind11.h>
 #include <pybind11/stl.h>
 
+#ifdef __SSE2__
+#include <emmintrin.h>
+#endif
+
 namespace py = pybind11;
 
+/**
+* Byte classes for the main loop, looked up in a 256-entry table instead of
+* a chain of compares (the table-lookup classification of simdjson stage 1).
+*/
+enum CharClass : uint8_t { OTHER, WHITESPACE, STRUCTURAL };
+
+static constexpr std::array<uint8_t, 256> makeCharClass() {
+    std::array<uint8_t, 256> table{};
+    for (unsigned char c : {' ', '\n', '\t', '\r'}) {
+        table[c] = WHITESPACE;
+    }
+    for (unsigned char c : {'{', '}', '"', ':', ','}) {
+        table[c] = STRUCTURAL;
+    }
+    return table;
+}
+
+static constexpr std::array<uint8_t, 256> charClass = makeCharClass();
+
+/**
+* Returns a pointer to the first '"' in [p, end), or end if there is none.
+* Scans 16 bytes at a time with SSE2 where available (simdjson stage 1 style),
+* the tail and non-SSE2 builds fall back to a scalar loop.
+*/
+static const char* findQuote(const char* p, const char* end) {
+#ifdef __SSE2__
+    const __m128i quote = _mm_set1_epi8('"');
+    while (end - p >= 16) {
+        __m128i chunk = _mm_loadu_si128(reinterpret_cast<const __m128i*>(p));
+        unsigned mask = static_cast<unsigned>(_mm_movemask_epi8(_mm_cmpeq_epi8(chunk, quote)));
+        if (mask != 0) {
+            return p + std::countr_zero(mask);
+        }
+        p += 16;
+    }
+#endif
+    while (p < end && *p != '"') {
+        ++p;
+    }
+    return p;
+}
+
+/**
+* Returns a pointer past the run of whitespace starting at p. Pretty-printed
+* input indents with long runs of spaces, which are skipped 16 at a time.
+*/
+static const char* skipWhitespace(const char* p, const char* end) {
+#ifdef __SSE2__
+    const __m128i space = _mm_set1_epi8(' ');
+    const __m128i newline = _mm_set1_epi8('\n');
+    const __m128i tab = _mm_set1_epi8('\t');
+    const __m128i cr = _mm_set1_epi8('\r');
+    while (end - p >= 16) {
+        __m128i chunk = _mm_loadu_si128(reinterpret_cast<const __m128i*>(p));
+        __m128i ws = _mm_or_si128(
+            _mm_or_si128(_mm_cmpeq_epi8(chunk, space), _mm_cmpeq_epi8(chunk, newline)),
+            _mm_or_si128(_mm_cmpeq_epi8(chunk, tab), _mm_cmpeq_epi8(chunk, cr)));
+        unsigned mask = ~static_cast<unsigned>(_mm_movemask_epi8(ws)) & 0xFFFF;
+        if (mask != 0) {
+            return p + std::countr_zero(mask);
+        }
+        p += 16;
+    }
+#endif
+    while (p < end && charClass[static_cast<unsigned char>(*p)] == WHITESPACE) {
+        ++p;
+    }
+    return p;
+}
+
+/**
+* Result of checkUtf8: [0, valid) decodes. If bad_end is set, [valid, bad_end)
+* is invalid for `reason`. Otherwise the input either ended on a char boundary
+* or with the start of a char that needs more bytes.
+*/
+struct Utf8Check {
+    size_t valid;
+    size_t bad_end;
+    const char* reason;
+};
+
+/**
+* Validates UTF-8 like Python's strict decoder (no overlong forms, surrogates
+* or code points past U+10FFFF). ASCII is skipped 16 bytes at a time with SSE2.
+*/
+static Utf8Check checkUtf8(const char* data, size_t n) {
+    size_t i = 0;
+    while (i < n) {
+#ifdef __SSE2__
+        while (n - i >= 16
+                && _mm_movemask_epi8(_mm_loadu_si128(reinterpret_cast<const __m128i*>(data + i))) == 0) {
+            i += 16;
+        }
+        if (i == n) {
+            break;
+        }
+#endif
+        const unsigned char lead = static_cast<unsigned char>(data[i]);
+        if (lead < 0x80) {
+            ++i;
+            continue;
+        }
+        // Allowed range of the second byte, the others are always 80..BF
+        size_t needed;
+        unsigned char lo = 0x80;
+        unsigned char hi = 0xBF;
+        if (lead >= 0xC2 && lead <= 0xDF) {
+            needed = 2;
+        } else if (lead >= 0xE0 && lead <= 0xEF) {
+            needed = 3;
+            if (lead == 0xE0) lo = 0xA0;
+            // Python's decoder only rejects a surrogate once all of it is
+            // there, a cut off one is held back like any other char.
+            if (lead == 0xED && n - i >= 3) hi = 0x9F;
+        } else if (lead >= 0xF0 && lead <= 0xF4) {
+            needed = 4;
+            if (lead == 0xF0) lo = 0x90;
+            if (lead == 0xF4) hi = 0x8F;
+        } else {
+            return {i, i + 1, "invalid start byte"};
+        }
+        for (size_t k = 1; k < needed; ++k) {
+            if (i + k == n) {
+                return {i, 0, nullptr};
+            }
+            const unsigned char next = static_cast<unsigned char>(data[i + k]);
+            if (next < lo || next > hi) {
+                return {i, i + k, "invalid continuation byte"};
+            }
+            lo = 0x80;
+            hi = 0xBF;
+        }
+        i += needed;
+    }
+    return {n, 0, nullptr};
+}
+
+// Number of UTF-8 code points in [p, end), i.e. bytes that aren't continuation bytes.
+static size_t countCodePoints(const char* p, const char* end) {
+    size_t n = 0;
+    for (; p < end; ++p) {
+        n += (static_cast<unsigned char>(*p) & 0xC0) != 0x80;
+    }
+    return n;
+}
+
 
 // Default function parameter value is ONLY specified in header
-StreamingJsonParser::StreamingJsonParser(bool strict_mode) 
-    : state(START), strict_mode(strict_mode), result(std::make_unique<JsonObject>()) {
-    // Initialize the expected characters for each state
-    expected_chars[START] = "{";
-    expected_chars[EXPECT_KEY_OR_END] = "\"}";
-    expected_chars[EXPECT_COLON] = ":";
-    expected_chars[EXPECT_VALUE] = "\"{";
-    expected_chars[EXPECT_COMMA_OR_END] = ",}";
+StreamingJsonParser::StreamingJsonParser(bool strict_mode, bool track_checkpoints) 
+    : state(START), strict_mode(strict_mode), track_checkpoints(track_checkpoints),
+      result(std::make_unique<JsonObject>()) {
+    stack.push_back(result.get());
+}
+
+void StreamingJsonParser::reset() {
+    // Python only ever sees dicts built from the tree, never the tree itself,
+    // so it can be reused. The cached dict is dropped, callers keep theirs.
+    dirty = true;
+    result->truncate(0);
+    stack.resize(1);
+    state = START;
+    current_key.clear();
+    current_string = nullptr;
+    utf8_tail.clear();
+    checkpoints.clear();
+    consumed_chars = 0;
 }
 
-void StreamingJsonParser::consume(const std::string& buffer) {
-    for (const char c : buffer) {
-        if (isWhitespace(c) && state != IN_KEY && state != IN_VALUE) {
+StreamingJsonParser& StreamingJsonParser::consume(std::string_view buffer) {
+    const char* p = buffer.data();
+    const char* const end = p + buffer.size();
+    // Bytes up to here are already counted in consumed_chars
+    const char* counted = p;
+    if (p != end) {
+        dirty = true;
+    }
+    while (p < end) {
+        // Fast path: inside a string only '"' is significant, so copy the
+        // whole run up to it in one go instead of dispatching per char.
+        if (state == IN_KEY || state == IN_VALUE) {
+            const char* quote = findQuote(p, end);
+            if (state == IN_KEY) {
+                current_key.append(p, quote - p);
+            } else {
+                current_string->append(p, quote - p);
+            }
+            p = quote;
+            if (p == end) {
+                break;
+            }
+        }
+
+        // Not inside a string here, only structural chars can move the
+        // state machine. Anything else is skipped unless strict mode has
+        // to reject it.
+        const char c = *p++;
+        const uint8_t cls = charClass[static_cast<unsigned char>(c)];
+        if (cls == WHITESPACE) {
+            p = skipWhitespace(p, end);
+            continue;
+        }
+        if (cls == OTHER && !strict_mode) {
             continue;
         }
         
         if (strict_mode) {
-            auto it = expected_chars.find(state);
-            if (it != expected_chars.end() && it->second.find(c) == std::string::npos) {
-                throw std::runtime_error(
-                    "Got " + std::string(1, c) + " but expected one of " + it->second
+            const std::string_view expected = expected_chars[state];
+            if (!expected.empty() && expected.find(c) == std::string_view::npos) {
+                // Quote the whole char, not just its first byte, so the message
+                // stays valid UTF-8. invalid_argument surfaces as ValueError,
+                // like the Python fallback.
+                const unsigned char lead = static_cast<unsigned char>(c);
+                const size_t len = lead < 0xC0 ? 1 : lead < 0xE0 ? 2 : lead < 0xF0 ? 3 : 4;
+                const std::string_view got(p - 1, std::min<size_t>(len, end - (p - 1)));
+                throw std::invalid_argument(
+                    "Got " + std::string(got) + " but expected " + std::string(expected_msg[state])
                 );
             }
         }
         
+        const State prev = state;
         processChar(c);
+        // expected_chars lists exactly the chars with a transition per state
+        if (track_checkpoints && (c == '{' || c == '}' || c == ',')
+                && expected_chars[prev].find(c) != std::string_view::npos) {
+            consumed_chars += countCodePoints(counted, p);
+            counted = p;
+            addCheckpoint();
+        }
     }
+    if (track_checkpoints) {
+        consumed_chars += countCodePoints(counted, end);
+    }
+    return *this;
 }
 
-bool StreamingJsonParser::isWhitespace(char c) const {
-    return c == ' ' || c == '\n' || c == '\t' || c == '\r';
+StreamingJsonParser& StreamingJsonParser::consumeBytes(std::string_view buffer) {
+    std::string joined;
+    if (!utf8_tail.empty()) {
+        joined.reserve(utf8_tail.size() + buffer.size());
+        joined.append(utf8_tail).append(buffer);
+        buffer = joined;
+    }
+    const Utf8Check check = checkUtf8(buffer.data(), buffer.size());
+    if (check.bad_end != 0) {
+        // The same exception Python's decoder raises
+        PyObject* error = PyUnicodeDecodeError_Create(
+            "utf-8", buffer.data(), buffer.size(), check.valid, check.bad_end, check.reason);
+        if (error != nullptr) {
+            PyErr_SetObject(PyExc_UnicodeDecodeError, error);
+            Py_DECREF(error);
+        }
+        throw py::error_already_set();
+    }
+    utf8_tail.assign(buffer.substr(check.valid));
+    return consume(buffer.substr(0, check.valid));
 }
 
-void StreamingJsonParser::processChar(char c) {
-    JsonObject* current_obj = stack.empty() ? result.get() : stack.back();
+void StreamingJsonParser::addCheckpoint() {
+    Checkpoint checkpoint{consumed_chars, state, stack, {}};
+    checkpoint.sizes.reserve(stack.size());
+    for (JsonObject* obj : stack) {
+        checkpoint.sizes.push_back(obj->size());
+    }
+    checkpoints.push_back(std::move(checkpoint));
+}
+
+size_t StreamingJsonParser::rewindTo(size_t pos) {
+    while (!checkpoints.empty() && checkpoints.back().pos > pos) {
+        checkpoints.pop_back();
+    }
+    current_string = nullptr;
+    utf8_tail.clear();
+    dirty = true;
+    if (checkpoints.empty()) {
+        result->truncate(0);
+        stack.resize(1);
+        state = START;
+        consumed_chars = 0;
+        return 0;
+    }
+    const Checkpoint& checkpoint = checkpoints.back();
+    // Parents first: a child on the stack was added before the snapshot, so
+    // truncating its parent keeps it alive.
+    for (size_t i = 0; i < checkpoint.stack.size(); ++i) {
+        checkpoint.stack[i]->truncate(checkpoint.sizes[i]);
+    }
+    stack = checkpoint.stack;
+    state = checkpoint.state;
+    consumed_chars = checkpoint.pos;
+    return checkpoint.pos;
+}
 
+void StreamingJsonParser::processChar(char c) {
     switch (state) {
         case START:
             if (c == '{') {
@@ -64,32 +328,23 @@ void StreamingJsonParser::processChar(char c) {
         case EXPECT_KEY_OR_END:
             if (c == '"') {
                 state = IN_KEY;
-                current_key = "";
+                current_key.clear();  // keeps the capacity
             } else if (c == '}') {
-                if (!stack.empty()) {
-                    stack.pop_back();
-                }
-                state = EXPECT_COMMA_OR_END;
+                closeObject();
             }
             break;
             
+        // consume() appends string bodies in bulk, only the closing quote
+        // reaches us in these two states.
         case IN_KEY:
-            if (c == '"') {
-                state = EXPECT_COLON;
-            } else {
-                current_key += c;
-            }
+            assert(c == '"');
+            state = EXPECT_COLON;
             break;
             
         case IN_VALUE:
-            if (c == '"') {
-                state = EXPECT_COMMA_OR_END;
-            } else {
-                auto* value = current_obj->get(current_key);
-                assert(value != nullptr && value->isString() && "current_obj not inited in IN_VALUE");
-                // since value is a JsonValue*, must cast to JsonString*
-                dynamic_cast<JsonString*>(value)->append(c);
-            }
+            assert(c == '"');
+            state = EXPECT_COMMA_OR_END;
+            current_string = nullptr;
             break;
             
         case EXPECT_COLON:
@@ -98,11 +353,21 @@ void StreamingJsonParser::processChar(char c) {
             }
             break;
             
-        case EXPECT_VALUE:
+        case EXPECT_VALUE: {
+            // The root sits at the bottom of the stack, so there is always a
+            // current object and no branch is needed to find it.
+            JsonObject* current_obj = stack.back();
+            // Truncating objects can't undo overwriting a key, and would leave
+            // checkpoints pointing at a freed object. Drop them in that case.
+            if ((c == '"' || c == '{') && !checkpoints.empty() && current_obj->has(current_key)) {
+                checkpoints.clear();
+            }
             if (c == '"') {
                 // we know it's a string value so set cur_obj[cur_key] = ""
                 state = IN_VALUE;
-                current_obj->set(current_key, std::make_unique<JsonString>());
+                auto newStr = std::make_unique<JsonString>();
+                current_string = newStr.get();
+                current_obj->set(current_key, std::move(newStr));
             } else if (c == '{') {
                 auto newObj = std::make_unique<JsonObject>();
                 JsonObject* objPtr = newObj.get();
@@ -118,16 +383,23 @@ void StreamingJsonParser::processChar(char c) {
                 state = EXPECT_KEY_OR_END;
             }
             break;
+        }
             
         case EXPECT_COMMA_OR_END:
             if (c == ',') {
                 state = EXPECT_KEY_OR_END;
             } else if (c == '}') {
-                if (!stack.empty()) {
-                    stack.pop_back();
-                }
-                state = EXPECT_COMMA_OR_END;
+                closeObject();
             }
             break;
     }
 }
+
+// Shared by EXPECT_KEY_OR_END and EXPECT_COMMA_OR_END: finish the innermost
+// object and continue with its parent (the root is never popped).
+void StreamingJsonParser::closeObject() {
+    if (stack.size() > 1) {
+        stack.pop_back();
+    }
+    state = EXPECT_COMMA_OR_END;
+}
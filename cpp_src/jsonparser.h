@@ -5,7 +5,9 @@
 */
 #pragma once
 
+#include <array>
 #include <string>
+#include <string_view>
 #include <unordered_map>
 #include <vector>
 #include <memory>
@@ -43,7 +45,7 @@ public:
     bool isString() const override { return true; }
     bool isObject() const override { return false; }
     
-    void append(char c) { value += c; }
+    void append(const char* data, size_t len) { value.append(data, len); }
     
     py::object toPython() const override {
         return py::str(value);
@@ -63,7 +65,24 @@ public:
     
     // Add a key-value pair
     void set(const std::string& key, std::unique_ptr<JsonValue> value) {
-        members[key] = std::move(value);
+        auto [it, inserted] = members.insert_or_assign(key, std::move(value));
+        if (inserted) {
+            order.push_back(&*it);
+        }
+    }
+    
+    size_t size() const {
+        return order.size();
+    }
+    
+    // Drop every key added after the first n (see StreamingJsonParser::rewindTo)
+    void truncate(size_t n) {
+        for (size_t i = n; i < order.size(); ++i) {
+            members.erase(members.find(order[i]->first));
+        }
+        if (n < order.size()) {
+            order.resize(n);
+        }
     }
     
     // Check if a key exists
@@ -71,23 +90,21 @@ public:
         return members.find(key) != members.end();
     }
     
-    // Get a value by key
-    JsonValue* get(const std::string& key) {
-        auto it = members.find(key);
-        return it != members.end() ? it->second.get() : nullptr;
-    }
-    
     // Construct a python dictionary with py::objects as keys and values.
     py::object toPython() const override {
         py::dict result;
-        for (const auto& [key, value] : members) {
-            result[py::str(key)] = value->toPython();
+        for (const Member* member : order) {
+            result[py::str(member->first)] = member->second->toPython();
         }
         return result;
     }
     
 private:
+    using Member = std::pair<const std::string, std::unique_ptr<JsonValue>>;
     std::unordered_map<std::string, std::unique_ptr<JsonValue>> members;
+    // Members in insertion order, like a Python dict. Pointers to map nodes
+    // stay valid across rehashes.
+    std::vector<Member*> order;
 };
 
 /**
@@ -106,31 +123,94 @@ public:
         EXPECT_COMMA_OR_END = 6  // expect , or }
     };
     
-    StreamingJsonParser(bool strict_mode = false);
+    StreamingJsonParser(bool strict_mode = false, bool track_checkpoints = false);
     ~StreamingJsonParser() = default;
     
-    void consume(const std::string& buffer);
+    // Returns the parser so calls can be chained, like the Python fallback
+    StreamingJsonParser& consume(std::string_view buffer);
+
+    // consume for UTF-8 bytes that haven't been validated yet. Raises
+    // UnicodeDecodeError before touching any state if they are invalid, a
+    // char split across chunks is held back until the rest of it arrives.
+    StreamingJsonParser& consumeBytes(std::string_view buffer);
+    
+    // Back to the initial state for reuse, keeping allocated capacity
+    void reset();
+    
+    // Restore the last checkpoint at or before pos (in code points consumed)
+    // and return its position, see the Python fallback for details.
+    size_t rewindTo(size_t pos);
     
     // Don't confuse StreamingJsonParser::get and std::unqiue_ptr::get
     JsonObject* get() const {
         return result.get();
     }
     
-    // Get the result as a Python dict
+    // Get the result as a Python dict. The dict is cached until the tree
+    // changes, so polling without new input doesn't rebuild it. Callers share
+    // it: edits to it show up in later calls until the next consume, so it
+    // must not be mutated (use getPythonCopy), like the fallback's get().
     py::object getPython() const {
+        if (dirty || !cached_python) {
+            cached_python = result->toPython();
+            dirty = false;
+        }
+        return cached_python;
+    }
+
+    // Always a freshly built dict, never shared with get()
+    py::object getPythonCopy() const {
         return result->toPython();
     }
     
 private:
     std::unique_ptr<JsonObject> result;
     // Holds a stack of pointers to JsonObjects, make sure that pointers pushed
-    // here have lifetimes that exceed the time on stack.
+    // here have lifetimes that exceed the time on stack. result is always at
+    // the bottom, so stack.back() is the object being filled.
     std::vector<JsonObject*> stack;
     State state;
     std::string current_key;
+    // Non-owning pointer to the string value being filled while in IN_VALUE.
+    // Owned by its parent JsonObject, which outlives the IN_VALUE state.
+    JsonString* current_string = nullptr;
     bool strict_mode;
-    std::unordered_map<State, std::string> expected_chars;
+    // Start of a char cut off at the end of the last consumeBytes chunk
+    std::string utf8_tail;
+    // Last dict handed out by getPython, rebuilt once dirty is set
+    mutable py::object cached_python;
+    mutable bool dirty = true;
+    
+    // Snapshot taken after every structural char when track_checkpoints is
+    // set. Objects only grow by appending keys, so their sizes are enough
+    // to restore them.
+    struct Checkpoint {
+        size_t pos;
+        State state;
+        std::vector<JsonObject*> stack;
+        std::vector<size_t> sizes;  // key count per stack entry
+    };
+    bool track_checkpoints;
+    std::vector<Checkpoint> checkpoints;
+    // Code points consumed so far (Python indexes str by code point)
+    size_t consumed_chars = 0;
+    // Chars accepted in each state in strict mode, indexed by State.
+    // Empty means anything goes (inside keys and values).
+    static constexpr std::array<std::string_view, 7> expected_chars = {
+        "{",    // START
+        "\"}",  // EXPECT_KEY_OR_END
+        "",     // IN_KEY
+        "",     // IN_VALUE
+        ":",    // EXPECT_COLON
+        "\"{",  // EXPECT_VALUE
+        ",}"    // EXPECT_COMMA_OR_END
+    };
+    // Strict mode error text per state, same wording as the Python fallback
+    static constexpr std::array<std::string_view, 7> expected_msg = {
+        "{", "\" or }", "", "", ":", "\" or {", ", or }"
+    };
     
-    bool isWhitespace(char c) const;
     void processChar(char c);
+    void closeObject();
+    void addCheckpoint();
 };
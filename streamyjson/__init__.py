@@ -1,17 +1,40 @@
+from collections import deque
 
 # Current reasons why this middle layer exists:
 # - Expose only the public API from the internal C++ extension module.
 # - Keeping this layer enables a stable and clean interface for users.
 # - Fallback mechanisms to pure Python implementation
+# - Python-side helpers that work with either backend (ParserPool)
 
 # Underscore in _core and _json_parse to not expose them (modules ignore __all__)
 try:
     from ._core import parse_json, StreamingJsonParser
-except:
+except ImportError:
     print('Running the non-optimized python impl')
     from ._json_parse import parse_json, StreamingJsonParser
 
-__all__ = ['parse_json', 'StreamingJsonParser']
+
+class ParserPool:
+    """
+    Pool of warmed-up parsers for servers handling many streams: release()
+    resets a parser and keeps it for the next acquire() instead of allocating
+    a new one. deque append/pop are atomic, so threads can share a pool.
+    """
+    def __init__(self, strict_mode: bool = False, maxsize: int = 64):
+        self.strict_mode = strict_mode
+        self._free = deque(maxlen=maxsize)
+
+    def acquire(self) -> StreamingJsonParser:
+        try:
+            return self._free.pop()
+        except IndexError:
+            return StreamingJsonParser(self.strict_mode)
+
+    def release(self, parser: StreamingJsonParser) -> None:
+        parser.reset()
+        self._free.append(parser)
+
+__all__ = ['parse_json', 'StreamingJsonParser', 'ParserPool']
 
 # Potential future reasons:
 # - Provide a clean, minimal public API, hiding internal implementation details.
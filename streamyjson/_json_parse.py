@@ -23,6 +23,43 @@ An extreme example:
     parsing random{random"hi"any characters until : is reached"val"random}random would be {"hi", "val"}
 This may be a wanted or not depending on the state of the LLM. 
 """
+import codecs
+import json
+import re
+import sys
+
+def _subset_object(pairs: list) -> dict:
+    # Checks every pair, a duplicate key could otherwise hide e.g. a number.
+    for _, value in pairs:
+        if not isinstance(value, (str, dict)):
+            raise ValueError('value outside of the supported JSON subset')
+    return dict(pairs)
+
+# Used for whole documents, see StreamingJsonParser._decode_complete.
+# strict=False accepts raw control chars inside strings like our parser does.
+_DECODER = json.JSONDecoder(strict=False, object_pairs_hook=_subset_object)
+
+# Run of whitespace between tokens, matched in bulk by the regex engine.
+_WS_RE = re.compile(r'[ \n\t\r]+')
+
+# A complete "key": "value" member plus its comma if present. Flat records are
+# most of what gets streamed, so these are taken in one match each.
+_PAIR_RE = re.compile(r'[ \n\t\r]*"([^"]*)"[ \n\t\r]*:[ \n\t\r]*"([^"]*)"([ \n\t\r]*,)?')
+
+# consume() reads these as globals rather than copying them into locals on
+# every call, which dominated when streaming a few chars at a time.
+_ws_match = _WS_RE.match
+_pair_match = _PAIR_RE.match
+_intern = sys.intern
+
+# Parser states, see StreamingJsonParser for what each one expects
+_START = 0
+_EXPECT_KEY_OR_END = 1
+_IN_KEY = 2
+_IN_VALUE = 3
+_EXPECT_COLON = 4
+_EXPECT_VALUE = 5
+_EXPECT_COMMA_OR_END = 6
 
 class StreamingJsonParser:
     """
@@ -48,13 +85,13 @@ class StreamingJsonParser:
     """
     
     # Possible states we can be in, with their transitions explained
-    START = 0               # expect {
-    EXPECT_KEY_OR_END = 1   # expect " or }
-    IN_KEY = 2              # expect char or end quote "
-    IN_VALUE = 3            # expect char or end quote "
-    EXPECT_COLON = 4        # expect :
-    EXPECT_VALUE = 5        # expect start quote " or {
-    EXPECT_COMMA_OR_END = 6 # expect , or }
+    START = _START                              # expect {
+    EXPECT_KEY_OR_END = _EXPECT_KEY_OR_END      # expect " or }
+    IN_KEY = _IN_KEY                            # expect char or end quote "
+    IN_VALUE = _IN_VALUE                        # expect char or end quote "
+    EXPECT_COLON = _EXPECT_COLON                # expect :
+    EXPECT_VALUE = _EXPECT_VALUE                # expect start quote " or {
+    EXPECT_COMMA_OR_END = _EXPECT_COMMA_OR_END  # expect , or }
 
     # WS chars we explicitly allow
     WHITESPACE = ' \n\t\r'
@@ -65,27 +102,63 @@ class StreamingJsonParser:
         EXPECT_VALUE: '"{',
         EXPECT_COMMA_OR_END: ',}'
     }
+    # Strict mode error text per state, built once instead of on every raise
+    EXPECTED_MSG = {state: ' or '.join(chars) for state, chars in EXPECTED_CHARS.items()}
 
-    def __init__(self, strict_mode:bool=False):
+    def __init__(self, strict_mode:bool=False, track_checkpoints:bool=False):
         self.result = {}
-        self.stack = []
+        # Open objects with the root at the bottom, kept as a preallocated list
+        # plus a depth cursor so entering/leaving an object is an index store
+        # rather than an append/pop, and the root needs no special casing.
+        self._frames = [self.result] + [None] * 15
+        self._depth = 0
         self.state = self.START
         self.current_key = ""
+        # Partial key/value text is buffered as a list of pieces and joined
+        # once at the closing quote, avoiding O(k^2) str concatenation.
+        self._key_parts = []
+        self._value_parts = []
+        # Object the pending value belongs to, written to only at the closing
+        # quote or on get(), never per streamed char.
+        self._value_obj = None
+        # Number of value parts already written by get(), to skip the join
+        # when it's polled again without new data.
+        self._value_flushed = 0
         self.strict_mode = strict_mode
+        # Snapshots (pos, state, frames, frame sizes) taken after every
+        # structural char, see rewind_to(). _pos counts chars consumed.
+        self.track_checkpoints = track_checkpoints
+        self._checkpoints = []
+        self._pos = 0
+        # Holds back a multi-byte char split across consume_bytes() chunks.
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+
+    def reset(self) -> None:
+        """
+        Returns the parser to its initial state so it can be reused for a new
+        stream (see ParserPool). Containers are cleared in place instead of
+        reallocated, only the result is new since callers may still hold the old one.
+        """
+        self.result = {}
+        self._frames[0] = self.result
+        self._frames[1:] = [None] * (len(self._frames) - 1)
+        self._depth = 0
+        self.state = self.START
+        self.current_key = ""
+        self._key_parts.clear()
+        self._value_parts.clear()
+        self._value_obj = None
+        self._value_flushed = 0
+        self._checkpoints.clear()
+        self._pos = 0
+        self._utf8.reset()
     
-    def consume(self, buffer: str) -> None:
-        for c in buffer:
-            if c in self.WHITESPACE and self.state not in [self.IN_KEY, self.IN_VALUE]:
-                continue
-            if self.strict_mode:
-                if self.state in self.EXPECTED_CHARS and c not in self.EXPECTED_CHARS[self.state]:
-                    raise ValueError(f'Got {c} but expected {' or '.join(self.EXPECTED_CHARS[self.state])}')
-            self._process_char(c)
-    
-    def _process_char(self, char: str) -> None:
+    def consume(self, buffer: str) -> 'StreamingJsonParser':
         """
         Assertions:
-        When we enter this function we are sure any VALID whitespace has been removed.
+        Inside IN_KEY/IN_VALUE the string body is taken in bulk with str.find, so
+        the transition lookup only ever sees the closing quote there. Outside
+        strings any VALID whitespace is skipped before the lookup.
 
         Explaination:
         Start working on filling in the key:values of the object that has been pushed 
@@ -95,55 +168,251 @@ class StreamingJsonParser:
         working on the previous level.
         Note that we don't have to save the finished object explicitly since we are 
         working on the self.result object in-place.
+
+        Dispatch is a single lookup in TRANSITIONS, chars without a transition
+        are ignored. Only the loop counters and the state are locals, the rest
+        is read from module globals or self where used, so a call with a
+        single streamed token stays cheap.
         """
-        current_obj = self.stack[-1] if self.stack else self.result
-        match self.state:
-            case self.START:
-                if char == '{':
-                    self.state = self.EXPECT_KEY_OR_END
-            case self.EXPECT_KEY_OR_END:
-                if char == '"':
-                    self.state = self.IN_KEY
-                    self.current_key = ""
-                elif char == '}':
-                    if self.stack:
-                        self.stack.pop()
-                    self.state = self.EXPECT_COMMA_OR_END
-            case self.IN_KEY:
-                if char == '"':
-                    self.state = self.EXPECT_COLON
-                else:
-                    self.current_key += char
-            case self.IN_VALUE:
-                if char == '"':
-                    self.state = self.EXPECT_COMMA_OR_END
+        state = self.state
+        if state == _START and not self.track_checkpoints:
+            buffer = self._decode_complete(buffer)
+            state = self.state
+        i = 0
+        n = len(buffer)
+        while i < n:
+            # Inside a string only the closing quote is significant, so take
+            # the whole run up to it with a single (C-level) str.find and, if
+            # it's there, finish the string right away.
+            if state == _IN_KEY or state == _IN_VALUE:
+                j = buffer.find('"', i)
+                if j == -1:
+                    (self._key_parts if state == _IN_KEY else self._value_parts).append(buffer[i:])
+                    break
+                if state == _IN_KEY:
+                    self._end_key(buffer[i:j])
+                    state = _EXPECT_COLON
                 else:
-                    current_obj[self.current_key] += char
-            case self.EXPECT_COLON:
-                if char == ':':
-                    self.state = self.EXPECT_VALUE
-            case self.EXPECT_VALUE:
-                # Only when we start populating the VALUE we actually
-                # add the key:partial_value
-                if char == '"':
-                    self.state = self.IN_VALUE
-                    current_obj[self.current_key] = ""
-                # If the value turns out to be an object we add it to stack
-                elif char == '{':
-                    current_obj[self.current_key] = {}
-                    self.stack.append(current_obj[self.current_key])
-                    self.state = self.EXPECT_KEY_OR_END
-            case self.EXPECT_COMMA_OR_END:
-                if char == ',':
-                    self.state = self.EXPECT_KEY_OR_END
-                elif char == '}':
-                    if self.stack:
-                        self.stack.pop()
-                    self.state = self.EXPECT_COMMA_OR_END 
-                
+                    self._end_value(buffer[i:j])
+                    state = _EXPECT_COMMA_OR_END
+                i = j + 1
+                continue
+            c = buffer[i]
+            i += 1
+            # Not in a string here (handled above), so whitespace is skippable.
+            # Mostly it's a single space, only longer runs go to the regex.
+            if c in ' \n\t\r':
+                if i < n and buffer[i] in ' \n\t\r':
+                    i = _ws_match(buffer, i).end()
+                continue
+            transition = _TRANSITIONS[state].get(c)
+            if transition is None:
+                # Outside strings the chars with a transition are exactly the
+                # expected ones, so strict mode only has to look at misses.
+                if self.strict_mode and state in self.EXPECTED_MSG:
+                    self.state = state
+                    raise ValueError(f'Got {c} but expected {self.EXPECTED_MSG[state]}')
+                # Lenient mode ignores anything but the single char these two
+                # states wait for, so jump straight to it.
+                if state == _START or state == _EXPECT_COLON:
+                    j = buffer.find('{' if state == _START else ':', i)
+                    i = n if j == -1 else j
+                continue
+            state, action = transition
+            if action is not None:
+                action(self)
+            if self.track_checkpoints:
+                if c in '{},':
+                    self._checkpoint(self._pos + i, state)
+            elif state == _EXPECT_KEY_OR_END and n - i > 16:
+                # Insert complete string members straight away, the state
+                # machine picks up again at anything else (nested object,
+                # partial pair, junk). Skipped with checkpoints, which want
+                # a snapshot per comma, and for short tails which rarely
+                # hold a whole member.
+                m = _pair_match(buffer, i)
+                if m is not None:
+                    current_obj = self._frames[self._depth]
+                    while m is not None:
+                        current_obj[_intern(m[1])] = m[2]
+                        i = m.end()
+                        if m[3] is None:
+                            state = _EXPECT_COMMA_OR_END
+                            break
+                        m = _pair_match(buffer, i)
+            elif c == '}' and i < n and buffer[i] == '}':
+                # Nested objects end in a run of braces, pop it in one go
+                # instead of a lookup and _pop_obj call per brace. At the
+                # root a '}' pops nothing, so the depth stops at 0.
+                j = i + 1
+                while j < n and buffer[j] == '}':
+                    j += 1
+                depth = self._depth - (j - i)
+                self._depth = depth if depth > 0 else 0
+                i = j
+        self.state = state
+        self._pos += n
+        return self
+
+    def consume_bytes(self, buffer: bytes) -> 'StreamingJsonParser':
+        """
+        Like consume() for UTF-8 encoded input, e.g. raw HTTP chunks. A char
+        split across chunks is held back until its remaining bytes arrive.
+        """
+        if not isinstance(buffer, (bytes, bytearray)):
+            view = memoryview(buffer)
+            if view.ndim != 1 or view.itemsize != 1 or not view.c_contiguous:
+                raise TypeError('consume_bytes() needs a contiguous buffer of bytes')
+        return self.consume(self._utf8.decode(buffer))
+
+    def _decode_complete(self, buffer: str) -> str:
+        """
+        Fast path for a first chunk that holds a whole document: the C json module
+        parses it and the state machine only gets what's left after it. Only taken
+        when the outcome is identical, i.e. no escapes (which we keep verbatim) and
+        nothing but string/object values, otherwise the buffer comes back untouched.
+        """
+        match = _WS_RE.match(buffer)
+        start = match.end() if match else 0
+        if not buffer.startswith('{', start) or '}' not in buffer or '\\' in buffer:
+            return buffer
+        try:
+            obj, end = _DECODER.raw_decode(buffer, start)
+        except (ValueError, RecursionError):
+            return buffer
+        self.result.update(obj)
+        self.state = self.EXPECT_COMMA_OR_END
+        return buffer[end:]
+
+    # Actions run on a transition. The part lists are cleared in place since
+    # consume() holds them in locals.
+    def _start_key(self) -> None:
+        self._key_parts.clear()
+
+    # The string ends take the text after the last buffered part, usually the
+    # whole string, which then needs no join at all.
+    def _end_key(self, tail: str) -> None:
+        key_parts = self._key_parts
+        if key_parts:
+            key_parts.append(tail)
+            tail = ''.join(key_parts)
+        # Records in a stream tend to repeat the same keys, interning shares one
+        # str (and its cached hash) between all of them.
+        self.current_key = sys.intern(tail)
+
+    def _start_value(self) -> None:
+        # Only when we start populating the VALUE we actually
+        # add the key:partial_value
+        current_obj = self._frames[self._depth]
+        self._check_duplicate_key(current_obj)
+        current_obj[self.current_key] = ""
+        self._value_obj = current_obj
+        self._value_parts.clear()
+        self._value_flushed = 0
+
+    def _end_value(self, tail: str) -> None:
+        value_parts = self._value_parts
+        if value_parts:
+            value_parts.append(tail)
+            tail = ''.join(value_parts)
+        self._value_obj[self.current_key] = tail
+        self._value_obj = None
+
+    def _push_obj(self) -> None:
+        # If the value turns out to be an object we add it to stack
+        frames = self._frames
+        depth = self._depth
+        current_obj = frames[depth]
+        self._check_duplicate_key(current_obj)
+        new_obj = current_obj[self.current_key] = {}
+        depth += 1
+        if depth == len(frames):
+            frames.extend([None] * depth)
+        frames[depth] = new_obj
+        self._depth = depth
+
+    def _pop_obj(self) -> None:
+        # The root is never popped
+        if self._depth:
+            self._depth -= 1
+
+    # state -> {char: (next state, action)}
+    # Strings are left entirely to the fast path in consume(), which also
+    # handles their closing quote.
+    TRANSITIONS = [None] * 7
+    TRANSITIONS[START] = {'{': (EXPECT_KEY_OR_END, None)}
+    TRANSITIONS[EXPECT_KEY_OR_END] = {'"': (IN_KEY, _start_key), '}': (EXPECT_COMMA_OR_END, _pop_obj)}
+    TRANSITIONS[IN_KEY] = {}
+    TRANSITIONS[IN_VALUE] = {}
+    TRANSITIONS[EXPECT_COLON] = {':': (EXPECT_VALUE, None)}
+    TRANSITIONS[EXPECT_VALUE] = {'"': (IN_VALUE, _start_value), '{': (EXPECT_KEY_OR_END, _push_obj)}
+    TRANSITIONS[EXPECT_COMMA_OR_END] = {',': (EXPECT_KEY_OR_END, None), '}': (EXPECT_COMMA_OR_END, _pop_obj)}
+
+    def _checkpoint(self, pos: int, state: int) -> None:
+        frames = self._frames[:self._depth + 1]
+        self._checkpoints.append((pos, state, frames, [len(obj) for obj in frames]))
+
+    def _check_duplicate_key(self, current_obj: dict) -> None:
+        # Checkpoints restore objects by truncating them to their key count,
+        # which can't undo overwriting an existing key. Drop them in that case.
+        if self._checkpoints and self.current_key in current_obj:
+            self._checkpoints.clear()
+
+    def rewind_to(self, pos: int) -> int:
+        """
+        Restores the parser to the last checkpoint at or before `pos` (in chars
+        consumed so far) and returns that checkpoint's position. The caller
+        continues by consuming its input from there, e.g. when the last LLM
+        token got rewritten. Without checkpoints this is the start of the stream.
+        """
+        checkpoints = self._checkpoints
+        while checkpoints and checkpoints[-1][0] > pos:
+            checkpoints.pop()
+        if checkpoints:
+            pos, state, frames, sizes = checkpoints[-1]
+        else:
+            pos, state, frames, sizes = 0, self.START, [self.result], [0]
+        # Objects only ever grow by appending keys, so dropping the keys
+        # added after the snapshot restores them.
+        for obj, size in zip(frames, sizes):
+            for key in list(obj)[size:]:
+                del obj[key]
+        self._frames[:len(frames)] = frames
+        self._depth = len(frames) - 1
+        self.state = state
+        self._value_obj = None
+        self._pos = pos
+        self._utf8.reset()
+        return pos
+
     def get(self) -> dict:
+        """
+        Returns the live parse tree, mutating it corrupts the parser state.
+        Use get_copy() if the result is going to be modified.
+        """
+        # A partially streamed value only lives in _value_parts, so write
+        # it into its object before handing out the result.
+        # The parts are then collapsed into the joined text (in place, consume()
+        # aliases the list), so token-by-token streams don't keep one list
+        # entry per token and the next poll joins only what arrived since.
+        value_parts = self._value_parts
+        if self._value_obj is not None and len(value_parts) != self._value_flushed:
+            value = ''.join(value_parts)
+            self._value_obj[self.current_key] = value
+            value_parts[:] = (value,)
+            self._value_flushed = 1
         return self.result
 
+    def get_copy(self) -> dict:
+        return _copy_obj(self.get())
+
+# Global for consume(), like the other names it reads per char
+_TRANSITIONS = StreamingJsonParser.TRANSITIONS
+
+def _copy_obj(obj: dict) -> dict:
+    # Values are only str (immutable) or dict, so this is a deep copy.
+    return {k: _copy_obj(v) if isinstance(v, dict) else v for k, v in obj.items()}
+
 def parse_json(s: str, strict_mode=False) -> dict:
     return (
         StreamingJsonParser(strict_mode)
@@ -1,4 +1,4 @@
-from streamyjson import StreamingJsonParser
+from streamyjson import StreamingJsonParser, ParserPool, parse_json
 
 def run_tests():
     def test_streaming_json_parser():
@@ -105,6 +105,132 @@ def run_tests():
         parser.consume('"}}}')
         assert parser.get() == {"outer1": {"inner1": "value1"}, "outer2": {"inner2": {"deepkey": "deepvalue"}}}, parser.get()
         
+    def test_lenient_skips_junk():
+        doc = 'xx{"a" junk : "b"}'
+        parser = StreamingJsonParser()
+        parser.consume(doc)
+        assert parser.get() == {"a": "b"}, parser.get()
+        # Chunks ending inside the junk
+        parser = StreamingJsonParser()
+        for chunk in ('x', 'x{"a" ju', 'nk ', ': "b"}'):
+            parser.consume(chunk)
+        assert parser.get() == {"a": "b"}, parser.get()
+
+    def test_strict_mode():
+        parser = StreamingJsonParser(strict_mode=True)
+        try:
+            parser.consume('{x')
+            assert False, 'expected ValueError'
+        except ValueError as e:
+            assert str(e) == 'Got x but expected " or }', str(e)
+        try:
+            StreamingJsonParser(strict_mode=True).consume('{"a": "b"€')
+            assert False, 'expected ValueError'
+        except ValueError as e:
+            assert str(e) == 'Got € but expected , or }', str(e)
+        doc = '{ "a" : { "b" : "c" } ,\n\t"d": "e" }'
+        parser = StreamingJsonParser(strict_mode=True)
+        for c in doc:
+            parser.consume(c)
+        assert parser.get() == {"a": {"b": "c"}, "d": "e"}, parser.get()
+        assert parse_json(doc, strict_mode=True) == parser.get()
+
+    def test_get_copy():
+        parser = StreamingJsonParser()
+        parser.consume('{"foo": {"bar": "ba')
+        copy = parser.get_copy()
+        assert copy == {"foo": {"bar": "ba"}}
+        copy["foo"]["bar"] = "changed"
+        copy["new"] = "key"
+        parser.consume('z"}, "qux": "1"}')
+        assert parser.get() == {"foo": {"bar": "baz"}, "qux": "1"}, parser.get()
+        assert parser.get_copy() == parser.get()
+        # Polling without new input hands back the same dict
+        assert parser.get() is parser.get()
+        assert parser.get_copy() is not parser.get()
+
+    def test_parse_json():
+        parser = StreamingJsonParser()
+        assert parser.consume('{"a": ') is parser
+        assert parser.consume_bytes(b'"b"}') is parser
+        assert parse_json('{"a": {"b": "c"}, "d": "e') == {"a": {"b": "c"}, "d": "e"}
+
+    def test_consume_bytes():
+        doc = '{"a": "€ü", "b": {"c": "x"}}'
+        data = doc.encode()
+        parser = StreamingJsonParser()
+        parser.consume_bytes(data[:7])
+        # Half of € has arrived, it only shows up once complete
+        assert parser.get() == {"a": ""}, parser.get()
+        for i in range(7, len(data)):
+            parser.consume_bytes(data[i:i + 1])
+            parser.get()
+        expected = StreamingJsonParser()
+        expected.consume(doc)
+        assert parser.get() == expected.get(), parser.get()
+        # A char cut off by the closing quote is an error, not dropped
+        try:
+            StreamingJsonParser().consume_bytes(b'{"a": "x\xe2"}')
+            assert False, 'expected UnicodeDecodeError'
+        except UnicodeDecodeError:
+            pass
+        # Invalid UTF-8 raises before the parser sees any of it
+        parser = StreamingJsonParser()
+        try:
+            parser.consume_bytes(b'{"a": "x\xffy", "b": "c"}')
+            assert False, 'expected UnicodeDecodeError'
+        except UnicodeDecodeError:
+            pass
+        assert parser.get() == {}, parser.get()
+        assert parser.consume_bytes(b'{"a": "ok"}').get() == {"a": "ok"}
+        # Strided views can't be read as one run of bytes
+        for view in (memoryview(b'{"a": "hello"}')[::2], memoryview(b'{"a": "hello"}')[::-1]):
+            try:
+                StreamingJsonParser().consume_bytes(view)
+                assert False, 'expected TypeError'
+            except TypeError:
+                pass
+        assert StreamingJsonParser().consume_bytes(memoryview(b'xx{"a": "b"}')[2:]).get() == {"a": "b"}
+
+    def test_rewind_to_checkpoint():
+        text = '{"a": "1", "b": {"c": "2"}, "d": "€€'
+        parser = StreamingJsonParser(track_checkpoints=True)
+        parser.consume(text)
+        # Last token gets rewritten, resume from the last checkpoint before it
+        pos = parser.rewind_to(len(text) - 1)
+        assert text[:pos] == '{"a": "1", "b": {"c": "2"},', text[:pos]
+        assert parser.get() == {"a": "1", "b": {"c": "2"}}, parser.get()
+        parser.consume(' "e": "€"}')
+        assert parser.get() == {"a": "1", "b": {"c": "2"}, "e": "€"}, parser.get()
+        assert parser.rewind_to(0) == 0
+        assert parser.get() == {}
+
+    def test_parser_pool():
+        pool = ParserPool()
+        parser = pool.acquire()
+        parser.consume('{"foo": {"bar": "ba')
+        old = parser.get()
+        pool.release(parser)
+        assert pool.acquire() is parser
+        assert parser.get() == {}
+        parser.consume('{"x": "y"}')
+        assert parser.get() == {"x": "y"}, parser.get()
+        assert old == {"foo": {"bar": "ba"}}, old
+
+    def test_complete_document_matches_streaming():
+        docs = [
+            '{"a": "b\\n", "c": {"d": "e"}} tail',
+            '{"a": 1, "b": "c"}',
+            '{"a": "1", "a": {"b": "c"}}',
+        ]
+        for doc in docs:
+            whole = StreamingJsonParser()
+            whole.consume(doc)
+            chars = StreamingJsonParser()
+            for c in doc:
+                chars.consume(c)
+            assert whole.get() == chars.get(), (doc, whole.get(), chars.get())
+
     for name, f in locals().items():
         f()
         print(f'[v] {name}')